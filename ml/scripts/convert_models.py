@@ -15,8 +15,15 @@ devices. Quality may differ from the full-resolution training models.
 from __future__ import annotations
 
 import argparse
+import copy
+import json
 import logging
+import os
+import pickle
+import shutil
 import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 import torch
@@ -31,6 +38,24 @@ sys.path.insert(0, str(UNIDO_ROOT))
 logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
 LOG = logging.getLogger("convert")
 
+# Input normalization used during training (ImageNet)
+IMAGENET_MEAN = (0.485, 0.456, 0.406)
+IMAGENET_STD = (0.229, 0.224, 0.225)
+
+# Rice types accepted as comment_idx (0=Paddy, 1=Brown, 2=White)
+COMMENT_NAMES = ("paddy", "brown", "white")
+NUM_COMMENTS = len(COMMENT_NAMES)
+
+
+def create_backbone(
+    model_name: str = "convnextv2_nano.fcmae_ft_in22k_in1k",
+    pretrained: bool = False,
+) -> nn.Module:
+    """Create the timm feature backbone (pooled features, no classifier)."""
+    return timm.create_model(
+        model_name, pretrained=pretrained, num_classes=0, global_pool="avg"
+    )
+
 
 class RiceRegressorMobile(nn.Module):
     """
@@ -39,6 +64,11 @@ class RiceRegressorMobile(nn.Module):
     This version is self-contained (no external imports needed) and
     optimized for ONNX/TFLite export with fixed batch size and
     simpler comment handling.
+    
+    The training head `Linear(cat([feats, comment_emb(c)]))` plus
+    `comment_bias(c)` is split algebraically into `head(feats)` and a single
+    per-comment bias table, so no concat or comment matmul runs at inference.
+    Training checkpoints are converted with `fold_comment_pathway`.
     """
 
     def __init__(
@@ -46,29 +76,21 @@ class RiceRegressorMobile(nn.Module):
         model_name: str = "convnextv2_nano.fcmae_ft_in22k_in1k",
         num_targets: int = 15,
         pretrained: bool = False,
-        drop_rate: float = 0.1,
         num_comments: int = 3,
-        comment_emb_dim: int = 32,
+        backbone: nn.Module | None = None,
     ):
         super().__init__()
         
-        # Create backbone
-        self.backbone = timm.create_model(
-            model_name, pretrained=pretrained, num_classes=0, global_pool="avg"
-        )
-        
-        # Comment embedding
-        self.comment_emb = nn.Embedding(num_comments, comment_emb_dim)
+        # Create backbone (or reuse a prebuilt one, e.g. a copy of a prototype)
+        if backbone is None:
+            backbone = create_backbone(model_name, pretrained)
+        self.backbone = backbone
         
-        # Per-comment bias
-        self.comment_bias = nn.Embedding(num_comments, num_targets)
+        # Regression head on image features only
+        self.head = nn.Linear(self.backbone.num_features, num_targets)
         
-        # Regression head  
-        in_dim = self.backbone.num_features + comment_emb_dim
-        self.head = nn.Sequential(
-            nn.Dropout(p=drop_rate),
-            nn.Linear(in_dim, num_targets),
-        )
+        # Per-comment bias: comment embedding through the head plus comment bias
+        self.combined_bias = nn.Embedding(num_comments, num_targets)
     
     def forward(self, x: torch.Tensor, comment_idx: torch.Tensor) -> torch.Tensor:
         """
@@ -79,10 +101,12 @@ class RiceRegressorMobile(nn.Module):
         Returns:
             Predictions [B, num_targets]
         """
-        feats = self.backbone(x)
-        c = self.comment_emb(comment_idx)
-        pred = self.head(torch.cat([feats, c], dim=1))
-        return pred + self.comment_bias(comment_idx).to(dtype=pred.dtype)
+        pred = self.head(self.backbone(x))
+        return pred + self.combined_bias(comment_idx)
+
+
+class BackboneMismatchError(ValueError):
+    """A checkpoint's backbone differs from the backbone shared by a combined model."""
 
 
 class CombinedRiceModel(nn.Module):
@@ -90,6 +114,12 @@ class CombinedRiceModel(nn.Module):
     Combined model that merges all 4 specialist models into one.
     
     This simplifies mobile deployment by requiring only a single model file.
+    By default each specialist keeps its own trained backbone; all backbones
+    read the same input and run back to back before any head, so they export
+    as parallel sibling branches. With `share_backbone=True` the image is
+    encoded once by a single backbone and only the lightweight heads and
+    per-comment biases run per specialist. This is only correct for
+    checkpoints whose backbones are identical (see `check_shared_backbone`).
     Each specialist's predictions are concatenated in the correct order.
     """
     
@@ -114,25 +144,86 @@ class CombinedRiceModel(nn.Module):
         self,
         model_name: str = "convnextv2_nano.fcmae_ft_in22k_in1k",
         pretrained: bool = False,
+        num_comments: int = 3,
+        share_backbone: bool = False,
     ):
         super().__init__()
         
-        # Create 4 specialist models
-        self.model1 = RiceRegressorMobile(model_name, num_targets=2, pretrained=pretrained)
-        self.model2 = RiceRegressorMobile(model_name, num_targets=2, pretrained=pretrained)
-        self.model3 = RiceRegressorMobile(model_name, num_targets=4, pretrained=pretrained)
-        self.model4 = RiceRegressorMobile(model_name, num_targets=7, pretrained=pretrained)
+        # One shared backbone, or one per specialist
+        self.share_backbone = share_backbone
+        # Extra backbones are copies of one prototype instead of fresh timm builds
+        num_backbones = 1 if share_backbone else len(self.MODEL_TARGETS)
+        proto = create_backbone(model_name, pretrained)
+        self.backbones = nn.ModuleList(
+            [proto] + [copy.deepcopy(proto) for _ in range(num_backbones - 1)]
+        )
+        
+        # One lightweight head and per-comment bias per specialist
+        in_dim = self.backbones[0].num_features
+        self.heads = nn.ModuleList(
+            nn.Linear(in_dim, len(targets)) for targets in self.MODEL_TARGETS.values()
+        )
+        self.combined_biases = nn.ModuleList(
+            nn.Embedding(num_comments, len(targets)) for targets in self.MODEL_TARGETS.values()
+        )
         
         # Build index mapping from model outputs to final target order
         self._build_output_mapping()
     
+    def map_specialist_keys(
+        self,
+        state_dict: dict[str, torch.Tensor],
+        model_num: int,
+        include_backbone: bool = True,
+    ) -> dict[str, torch.Tensor]:
+        """Rename folded specialist (RiceRegressorMobile) keys to this model's layout."""
+        head_idx = model_num - 1
+        backbone_idx = 0 if self.share_backbone else head_idx
+        mapped = {}
+        for key, value in state_dict.items():
+            if key.startswith("backbone."):
+                if include_backbone:
+                    mapped[f"backbones.{backbone_idx}.{key[len('backbone.'):]}"] = value
+            elif key.startswith("head."):
+                mapped[f"heads.{head_idx}.{key[len('head.'):]}"] = value
+            elif key.startswith("combined_bias."):
+                mapped[f"combined_biases.{head_idx}.{key[len('combined_bias.'):]}"] = value
+        return mapped
+    
+    def check_shared_backbone(
+        self,
+        backbone_state: dict[str, torch.Tensor],
+        source: Path,
+    ) -> None:
+        """Raise BackboneMismatchError if `source`'s backbone differs from the shared one."""
+        own_state = self.state_dict()
+        mismatched = [
+            key for key, value in backbone_state.items()
+            if key in own_state and not torch.equal(own_state[key], value)
+        ]
+        if mismatched:
+            raise BackboneMismatchError(
+                f"Backbone of {source} differs from the shared backbone "
+                f"({len(mismatched)} tensors); its head would get wrong features. "
+                "Export without --share-backbone."
+            )
+    
     def _build_output_mapping(self):
-        """Create mapping from individual model outputs to combined output order."""
-        self.output_indices = {}
+        """Create permutation from concatenated model outputs to combined output order."""
+        offsets = {}
+        offset = 0
+        for model_num, targets in self.MODEL_TARGETS.items():
+            offsets[model_num] = offset
+            offset += len(targets)
+        
+        # perm[global_idx] = position of that target in cat([out1, out2, out3, out4])
+        perm = [0] * len(self.TARGET_ORDER)
         for model_num, targets in self.MODEL_TARGETS.items():
             for local_idx, target in enumerate(targets):
                 global_idx = self.TARGET_ORDER.index(target)
-                self.output_indices[(model_num, local_idx)] = global_idx
+                perm[global_idx] = offsets[model_num] + local_idx
+        
+        self.register_buffer("perm", torch.tensor(perm, dtype=torch.long), persistent=False)
     
     def forward(self, x: torch.Tensor, comment_idx: torch.Tensor) -> torch.Tensor:
         """
@@ -143,33 +234,97 @@ class CombinedRiceModel(nn.Module):
         Returns:
             All 15 predictions [B, 15]
         """
-        # Run all models
-        out1 = self.model1(x, comment_idx)  # [B, 2]
-        out2 = self.model2(x, comment_idx)  # [B, 2]
-        out3 = self.model3(x, comment_idx)  # [B, 4]
-        out4 = self.model4(x, comment_idx)  # [B, 7]
-        
-        # Combine outputs in correct order
-        batch_size = x.shape[0]
-        combined = torch.zeros(batch_size, 15, device=x.device, dtype=x.dtype)
+        # Run every backbone on the same input before any head, so separate
+        # backbones have no data dependency on each other
+        feats = [backbone(x) for backbone in self.backbones]
+        if self.share_backbone:
+            feats = feats * len(self.heads)
         
-        # Map each model's outputs to correct positions
-        for local_idx in range(2):
-            combined[:, self.output_indices[(1, local_idx)]] = out1[:, local_idx]
-            combined[:, self.output_indices[(2, local_idx)]] = out2[:, local_idx]
-        for local_idx in range(4):
-            combined[:, self.output_indices[(3, local_idx)]] = out3[:, local_idx]
-        for local_idx in range(7):
-            combined[:, self.output_indices[(4, local_idx)]] = out4[:, local_idx]
+        # Outputs: [B, 2], [B, 2], [B, 4], [B, 7]
+        outs = [
+            head(f) + bias(comment_idx)
+            for head, bias, f in zip(self.heads, self.combined_biases, feats)
+        ]
         
-        return combined
+        # Reorder into target order with a single gather (Concat + Gather in ONNX)
+        flat = torch.cat(outs, dim=1)
+        return flat.index_select(1, self.perm)
+
+
+def fold_comment_pathway(state_dict: dict[str, torch.Tensor]) -> dict[str, torch.Tensor]:
+    """
+    Convert a training RiceRegressor state dict to the RiceRegressorMobile layout.
+    
+    The training head computes
+        W @ cat([feats, comment_emb[c]]) + b + comment_bias[c]
+    which equals
+        W_feat @ feats + b + (comment_emb @ W_c.T + comment_bias)[c]
+    so the comment embedding, its matmul and the comment bias fold into
+    one [num_comments, num_targets] table.
+    """
+    fold_keys = ("head.1.weight", "head.1.bias", "comment_emb.weight", "comment_bias.weight")
+    if not all(key in state_dict for key in fold_keys):
+        return state_dict
+    
+    folded = {key: value for key, value in state_dict.items() if key not in fold_keys}
+    weight = state_dict["head.1.weight"]
+    comment_emb = state_dict["comment_emb.weight"]
+    feat_dim = weight.shape[1] - comment_emb.shape[1]
+    
+    comment_term = comment_emb.double() @ weight[:, feat_dim:].double().T
+    folded["head.weight"] = weight[:, :feat_dim]
+    folded["head.bias"] = state_dict["head.1.bias"]
+    folded["combined_bias.weight"] = (
+        comment_term + state_dict["comment_bias.weight"].double()
+    ).to(dtype=weight.dtype)
+    return folded
 
 
-def load_checkpoint_weights(model: nn.Module, ckpt_path: Path, model_num: int) -> None:
-    """Load weights from a training checkpoint into mobile model."""
+def _torch_load(ckpt_path: Path):
+    """
+    Load a checkpoint on CPU, tensors only and memory-mapped where possible.
+    
+    With `weights_only=True` nothing but tensors and plain containers is
+    unpickled, and with `mmap=True` (PyTorch >= 2.1) tensors are only paged
+    in when accessed, so unused entries such as optimizer state never
+    occupy RAM. Falls back to full unpickling / eager loading otherwise.
+    """
+    for mmap in (True, False):
+        mmap_kwargs = {"mmap": True} if mmap else {}
+        try:
+            try:
+                return torch.load(
+                    ckpt_path, map_location="cpu", weights_only=True, **mmap_kwargs
+                )
+            except pickle.UnpicklingError:
+                LOG.warning(f"Checkpoint has non-tensor objects, fully unpickling: {ckpt_path}")
+                return torch.load(
+                    ckpt_path, map_location="cpu", weights_only=False, **mmap_kwargs
+                )
+        except (TypeError, RuntimeError) as e:
+            # Older PyTorch (no mmap kwarg) or legacy non-zip checkpoint format
+            if not mmap:
+                raise
+            LOG.debug(f"Memory-mapped load unavailable ({e}), loading eagerly")
+
+
+def load_checkpoint_weights(
+    model: nn.Module,
+    ckpt_path: Path,
+    model_num: int,
+    include_backbone: bool = True,
+) -> list[str]:
+    """
+    Load weights from a training checkpoint into mobile model.
+    
+    For a CombinedRiceModel, only the head of specialist `model_num` is
+    loaded, plus its backbone if `include_backbone` is set. Otherwise a
+    shared backbone is checked against the checkpoint's backbone instead.
+    Returns the names of the loaded tensors.
+    """
     LOG.info(f"Loading checkpoint: {ckpt_path}")
     
-    ckpt = torch.load(ckpt_path, map_location="cpu", weights_only=False)
+    ckpt = _torch_load(ckpt_path)
     
     # The checkpoint structure has nested heads
     if "heads" not in ckpt:
@@ -183,67 +338,328 @@ def load_checkpoint_weights(model: nn.Module, ckpt_path: Path, model_num: int) -
     if not state_dict:
         raise ValueError(f"No state_dict found in checkpoint: {ckpt_path}")
     
-    # Load compatible weights
-    model_state = model.state_dict()
-    loaded = 0
-    for key, value in state_dict.items():
-        if key in model_state and model_state[key].shape == value.shape:
-            model_state[key] = value
-            loaded += 1
+    state_dict = fold_comment_pathway(state_dict)
+    if isinstance(model, CombinedRiceModel):
+        state_dict = model.map_specialist_keys(state_dict, model_num)
+        if not include_backbone:
+            backbone_state = {
+                key: state_dict.pop(key) for key in list(state_dict)
+                if key.startswith("backbones.")
+            }
+            if model.share_backbone:
+                model.check_shared_backbone(backbone_state, ckpt_path)
+    
+    # Load compatible weights (compare shapes only, no copy of the model state)
+    own_shapes = {key: value.shape for key, value in model.state_dict().items()}
+    compatible = {
+        key: value for key, value in state_dict.items()
+        if own_shapes.get(key) == value.shape
+    }
     
-    model.load_state_dict(model_state)
-    LOG.info(f"Loaded {loaded}/{len(model_state)} parameters from checkpoint")
+    missing, unexpected = model.load_state_dict(compatible, strict=False)
+    LOG.info(
+        f"Loaded {len(compatible)}/{len(own_shapes)} parameters from checkpoint "
+        f"(missing={len(missing)}, unexpected={len(unexpected)})"
+    )
+    return list(compatible)
+
+
+class SpecializedRiceModel(nn.Module):
+    """
+    Wrap a rice model with a fixed rice type (comment_idx).
+    
+    The app picks the rice type before capture, so per-type models can take
+    the image as their only input. The comment lookup then reads a constant
+    index from a constant table and is folded away during ONNX export.
+    """
+    
+    def __init__(self, model: nn.Module, comment_idx: int):
+        super().__init__()
+        self.model = model
+        self.register_buffer(
+            "comment_idx", torch.tensor([comment_idx], dtype=torch.long), persistent=False
+        )
+    
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        """
+        Args:
+            x: Image tensor [B, 3, H, W]
+        
+        Returns:
+            Predictions of the wrapped model for the fixed rice type
+        """
+        return self.model(x, self.comment_idx.expand(x.shape[0]))
+
+
+def make_dummy_inputs(
+    input_size: int = 384,
+    batch_size: int = 1,
+) -> tuple[torch.Tensor, torch.Tensor]:
+    """Example (image, comment_idx) inputs for tracing and export."""
+    dummy_image = torch.randn(batch_size, 3, input_size, input_size)
+    dummy_comment = torch.zeros(batch_size, dtype=torch.long)
+    return dummy_image, dummy_comment
+
+
+def prepare_qat(model: nn.Module, input_size: int = 384) -> nn.Module:
+    """
+    Insert fake-quant observers for quantization-aware training (qnnpack).
+    
+    Finetune the returned model for 1-2 epochs in the training code, then
+    save its state_dict for `--qat-dir`. Comment bias lookups stay float.
+    """
+    from torch.ao.quantization import get_default_qat_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import prepare_qat_fx
+    
+    torch.backends.quantized.engine = "qnnpack"
+    qconfig_mapping = get_default_qat_qconfig_mapping("qnnpack").set_object_type(
+        nn.Embedding, None
+    )
+    model.train()
+    return prepare_qat_fx(model, qconfig_mapping, make_dummy_inputs(input_size))
+
+
+def convert_qat(model: nn.Module) -> nn.Module:
+    """Convert a finetuned QAT model to a quantized model for export."""
+    from torch.ao.quantization.quantize_fx import convert_fx
+    
+    model.eval()
+    return convert_fx(model)
+
+
+def load_qat_model(model: nn.Module, qat_path: Path, input_size: int = 384) -> nn.Module:
+    """Rebuild a QAT-finetuned model from its saved state_dict and quantize it."""
+    LOG.info(f"Loading QAT weights: {qat_path}")
+    qat_model = prepare_qat(model, input_size)
+    qat_model.load_state_dict(torch.load(qat_path, map_location="cpu", weights_only=True))
+    return convert_qat(qat_model)
+
+
+def fuse_for_export(model: nn.Module) -> nn.Module:
+    """
+    Fold inference no-ops and fusible layers in place before export.
+    
+    Dropout layers are replaced by Identity (no-ops in eval mode), and
+    Conv2d → BatchNorm2d pairs inside nn.Sequential blocks are folded into
+    a single Conv2d, so they export as one ONNX node.
+    """
+    from torch.nn.utils.fusion import fuse_conv_bn_eval
+    
+    model.eval()
+    dropped = fused = 0
+    for parent in list(model.modules()):
+        for name, child in list(parent.named_children()):
+            if isinstance(child, nn.modules.dropout._DropoutNd):
+                setattr(parent, name, nn.Identity())
+                dropped += 1
+        
+        # Only Sequential guarantees that child order is execution order
+        if isinstance(parent, nn.Sequential):
+            children = list(parent.named_children())
+            for (conv_name, conv), (bn_name, bn) in zip(children, children[1:]):
+                if isinstance(conv, nn.Conv2d) and isinstance(bn, nn.BatchNorm2d):
+                    setattr(parent, conv_name, fuse_conv_bn_eval(conv, bn))
+                    setattr(parent, bn_name, nn.Identity())
+                    fused += 1
+    
+    LOG.info(f"Removed {dropped} dropout layers, fused {fused} Conv+BN pairs")
+    return model
+
+
+def _export_device(model: nn.Module) -> torch.device:
+    """CUDA when available for tracing; quantized (QAT) kernels only run on CPU."""
+    quantized = any(
+        type(m).__module__.startswith("torch.ao.nn.quantized") for m in model.modules()
+    )
+    if torch.cuda.is_available() and not quantized:
+        return torch.device("cuda")
+    return torch.device("cpu")
+
+
+def trace_and_freeze(
+    model: nn.Module,
+    inputs: tuple[torch.Tensor, ...],
+) -> torch.jit.ScriptModule:
+    """Trace the model in eval mode and freeze it (parameters inlined as constants)."""
+    model.eval()
+    with torch.no_grad():
+        traced = torch.jit.trace(model, inputs, strict=False)
+    return torch.jit.freeze(traced)
 
 
 def export_to_onnx(
     model: nn.Module,
     output_path: Path,
     input_size: int = 384,
-) -> None:
-    """Export PyTorch model to ONNX format."""
-    model.eval()
+    static_batch: bool = True,
+    simplify: bool = True,
+    comment_idx: int | None = None,
+) -> list[str]:
+    """
+    Export PyTorch model to ONNX format and return its input names.
+    
+    With `static_batch` the graph is exported for batch size 1 only, which
+    lets constant folding and the TFLite converter specialize on fixed shapes.
+    With `simplify` the exported graph is cleaned up by `simplify_onnx`.
+    With `comment_idx` the model is specialized to that rice type and
+    exported with the image as its only input.
+    The model is fused in place with `fuse_for_export` first and traced in
+    channels-last (NHWC) memory format, matching onnx2tf's NHWC output.
+    The trace is frozen before export so parameters are inlined and
+    training-only branches are resolved to inference constants.
+    Tracing runs on the GPU when available; the ONNX file is device-agnostic.
+    """
+    fuse_for_export(model)
+    device = _export_device(model)
+    model = model.to(device=device, memory_format=torch.channels_last)
     
     # Create dummy inputs
-    batch_size = 1
-    dummy_image = torch.randn(batch_size, 3, input_size, input_size)
-    dummy_comment = torch.zeros(batch_size, dtype=torch.long)
+    dummy_image, dummy_comment = (t.to(device) for t in make_dummy_inputs(input_size))
+    dummy_image = dummy_image.contiguous(memory_format=torch.channels_last)
+    inputs = (dummy_image, dummy_comment)
+    input_names = ["image", "comment_idx"]
+    
+    if comment_idx is not None:
+        model = SpecializedRiceModel(model, comment_idx).to(device).eval()
+        inputs = (dummy_image,)
+        input_names = ["image"]
     
-    LOG.info(f"Exporting to ONNX: {output_path}")
+    dynamic_axes = None
+    if not static_batch:
+        dynamic_axes = {name: {0: "batch"} for name in input_names + ["predictions"]}
+    
+    LOG.info(f"Exporting to ONNX on {device}: {output_path}")
+    
+    frozen = trace_and_freeze(model, inputs)
     
     torch.onnx.export(
-        model,
-        (dummy_image, dummy_comment),
+        frozen,
+        inputs,
         output_path,
-        input_names=["image", "comment_idx"],
+        export_params=True,
+        input_names=input_names,
         output_names=["predictions"],
-        dynamic_axes={
-            "image": {0: "batch"},
-            "comment_idx": {0: "batch"},
-            "predictions": {0: "batch"},
-        },
+        dynamic_axes=dynamic_axes,
         opset_version=17,
         do_constant_folding=True,
     )
     
+    if simplify:
+        simplify_onnx(output_path)
+    
     LOG.info(f"ONNX export complete: {output_path}")
+    return input_names
 
 
-def convert_onnx_to_tflite(
-    onnx_path: Path,
-    output_path: Path,
-    quantize: bool = True,
-) -> None:
-    """Convert ONNX model to TFLite format."""
+# Graph cleanup passes applied when onnx-simplifier is not available
+ONNX_OPTIMIZER_PASSES = [
+    "eliminate_nop_dropout",
+    "eliminate_nop_transpose",
+    "fuse_bn_into_conv",
+    "fuse_add_bias_into_conv",
+    "fuse_matmul_add_bias_into_gemm",
+    "fuse_consecutive_transposes",
+    "eliminate_identity",
+]
+
+
+def simplify_onnx(onnx_path: Path) -> None:
+    """Simplify an exported ONNX graph in place (onnxsim, else onnxoptimizer)."""
+    try:
+        import onnx
+    except ImportError:
+        LOG.warning("onnx not installed, skipping graph simplification")
+        return
+    
+    model = onnx.load(str(onnx_path))
+    
+    try:
+        import onnxsim
+    except ImportError:
+        onnxsim = None
+    
+    if onnxsim is not None:
+        LOG.info(f"Simplifying ONNX graph with onnxsim: {onnx_path}")
+        model_simp, ok = onnxsim.simplify(model)
+        if not ok:
+            LOG.warning("onnxsim could not validate the simplified model, keeping original")
+            return
+    else:
+        try:
+            import onnxoptimizer
+        except ImportError:
+            LOG.warning(
+                "Skipping graph simplification. Install: pip install onnxsim (or onnxoptimizer)"
+            )
+            return
+        LOG.info(f"Optimizing ONNX graph with onnxoptimizer: {onnx_path}")
+        model_simp = onnxoptimizer.optimize(model, ONNX_OPTIMIZER_PASSES)
+    
+    LOG.info(f"ONNX nodes: {len(model.graph.node)} → {len(model_simp.graph.node)}")
+    onnx.save(model_simp, str(onnx_path))
+
+
+def make_representative_dataset(
+    calibration_dir: Path,
+    input_size: int = 384,
+    max_samples: int = 200,
+    channels_last: bool = False,
+    comment_idx: int | None = None,
+):
+    """
+    Build a TFLite representative dataset from sample rice images.
+    
+    Each image is resized and ImageNet-normalized like the mobile input;
+    rice types are cycled so every comment_idx is covered during calibration.
+    Images are yielded as [1, 3, H, W], or [1, H, W, 3] with `channels_last`.
+    For a model specialized to `comment_idx`, only the image is yielded.
+    """
+    try:
+        import numpy as np
+        from PIL import Image
+    except ImportError:
+        LOG.error("Missing dependencies. Install: pip install numpy pillow")
+        raise
+    
+    image_paths = sorted(
+        p for p in calibration_dir.iterdir()
+        if p.suffix.lower() in {".jpg", ".jpeg", ".png"}
+    )[:max_samples]
+    
+    if not image_paths:
+        raise ValueError(f"No calibration images found in: {calibration_dir}")
+    
+    LOG.info(f"Using {len(image_paths)} calibration images from {calibration_dir}")
+    
+    mean = np.array(IMAGENET_MEAN, dtype=np.float32).reshape(3, 1, 1)
+    std = np.array(IMAGENET_STD, dtype=np.float32).reshape(3, 1, 1)
+    
+    def representative_dataset():
+        for i, path in enumerate(image_paths):
+            image = Image.open(path).convert("RGB").resize(
+                (input_size, input_size), Image.BILINEAR
+            )
+            pixels = np.asarray(image, dtype=np.float32).transpose(2, 0, 1) / 255.0
+            pixels = (pixels - mean) / std
+            if channels_last:
+                pixels = pixels.transpose(1, 2, 0)
+            sample = {"image": pixels[np.newaxis].astype(np.float32)}
+            if comment_idx is None:
+                sample["comment_idx"] = np.array([i % NUM_COMMENTS], dtype=np.int64)
+            yield sample
+    
+    return representative_dataset
+
+
+def _export_saved_model_onnx_tf(onnx_path: Path, saved_model_dir: Path) -> None:
+    """Convert ONNX to a TensorFlow SavedModel with onnx-tf (NCHW layout)."""
     try:
         import onnx
         from onnx_tf.backend import prepare
-        import tensorflow as tf
     except ImportError:
         LOG.error("Missing dependencies. Install: pip install onnx onnx-tf tensorflow")
         raise
     
-    LOG.info(f"Converting ONNX to TFLite: {onnx_path} → {output_path}")
-    
     # Load ONNX model
     onnx_model = onnx.load(str(onnx_path))
     
@@ -251,64 +667,404 @@ def convert_onnx_to_tflite(
     tf_rep = prepare(onnx_model)
     
     # Export to SavedModel
-    saved_model_dir = output_path.parent / "temp_savedmodel"
     tf_rep.export_graph(str(saved_model_dir))
+
+
+def _export_saved_model_onnx2tf(onnx_path: Path, saved_model_dir: Path) -> None:
+    """
+    Convert ONNX to a TensorFlow SavedModel with onnx2tf (NHWC layout).
+    
+    onnx2tf also writes `<stem>_float32.tflite` and `<stem>_float16.tflite`
+    into `saved_model_dir`.
+    """
+    try:
+        import onnx2tf
+    except ImportError:
+        LOG.error("Missing dependencies. Install: pip install onnx onnx2tf tensorflow")
+        raise
+    
+    onnx2tf.convert(
+        input_onnx_file_path=str(onnx_path),
+        output_folder_path=str(saved_model_dir),
+        output_signaturedefs=True,
+        non_verbose=True,
+    )
+
+
+# tmpfs for temporary SavedModels, used when it has room for SHM_SPACE_FACTOR ×
+# the ONNX size (SavedModel plus onnx2tf's .tflite side outputs) per concurrent conversion
+SHM_DIR = Path("/dev/shm")
+SHM_SPACE_FACTOR = 4
+
+
+def _shm_tmp_root(onnx_path: Path, concurrent: int = 1) -> Path | None:
+    """
+    Return SHM_DIR if it can hold the temporary SavedModel, else None (default temp dir).
     
-    # Convert to TFLite
-    converter = tf.lite.TFLiteConverter.from_saved_model(str(saved_model_dir))
+    Space is reserved for `concurrent` conversions, since parallel workers
+    all check the free space before any of them writes.
+    """
+    if not SHM_DIR.is_dir():
+        return None
+    needed = onnx_path.stat().st_size * SHM_SPACE_FACTOR * concurrent
+    free = shutil.disk_usage(SHM_DIR).free
+    if free < needed:
+        LOG.info(
+            f"{SHM_DIR} has {free >> 20} MB free, need {needed >> 20} MB; "
+            "using default temp dir"
+        )
+        return None
+    return SHM_DIR
+
+
+def convert_onnx_to_tflite(
+    onnx_path: Path,
+    output_path: Path,
+    quantize: bool = True,
+    quantize_int8: bool = False,
+    calibration_dir: Path | None = None,
+    input_size: int = 384,
+    legacy_converter: bool = False,
+    comment_idx: int | None = None,
+    qat: bool = False,
+    concurrent: int = 1,
+) -> None:
+    """
+    Convert ONNX model to TFLite format.
     
-    if quantize:
-        converter.optimizations = [tf.lite.Optimize.DEFAULT]
-        converter.target_spec.supported_types = [tf.float16]
+    The SavedModel is produced by onnx2tf, which emits a native NHWC graph
+    (image input [1, H, W, 3]) without the per-layer layout transposes of
+    onnx-tf. `legacy_converter` falls back to onnx-tf (image input NCHW).
     
-    tflite_model = converter.convert()
+    `quantize` applies FP16 weight quantization. `quantize_int8` instead
+    applies full-integer post-training quantization calibrated on the
+    images in `calibration_dir`. With `qat` the ONNX graph carries trained
+    QuantizeLinear/DequantizeLinear pairs, which are folded into int8
+    kernels without a representative dataset; `quantize` is ignored.
+    Pass `comment_idx` for models exported specialized to one rice type,
+    and the number of conversions running in parallel as `concurrent`.
+    """
+    try:
+        import tensorflow as tf
+    except ImportError:
+        LOG.error("Missing dependencies. Install: pip install tensorflow")
+        raise
+    
+    if quantize_int8 and calibration_dir is None:
+        raise ValueError("INT8 quantization requires a calibration image directory")
+    
+    LOG.info(f"Converting ONNX to TFLite: {onnx_path} → {output_path}")
+    
+    def convert_in(tmp_root: Path | None) -> bytes:
+        with tempfile.TemporaryDirectory(dir=tmp_root) as tmpdir:
+            saved_model_dir = Path(tmpdir) / "saved_model"
+            if legacy_converter:
+                _export_saved_model_onnx_tf(onnx_path, saved_model_dir)
+            else:
+                _export_saved_model_onnx2tf(onnx_path, saved_model_dir)
+                
+                # onnx2tf already writes float32/float16 .tflite files next to the
+                # SavedModel; reuse them instead of converting a second time
+                if not (quantize_int8 or qat):
+                    precision = "float16" if quantize else "float32"
+                    onnx2tf_tflite = saved_model_dir / f"{onnx_path.stem}_{precision}.tflite"
+                    if onnx2tf_tflite.exists():
+                        return onnx2tf_tflite.read_bytes()
+            
+            # Convert to TFLite (always needed for onnx-tf, QAT and INT8 calibration)
+            converter = tf.lite.TFLiteConverter.from_saved_model(str(saved_model_dir))
+            
+            if qat:
+                # Fold the trained Q/DQ pairs into int8 kernels (scales come from QAT)
+                converter.optimizations = [tf.lite.Optimize.DEFAULT]
+            elif quantize_int8:
+                converter.optimizations = [tf.lite.Optimize.DEFAULT]
+                converter.representative_dataset = make_representative_dataset(
+                    calibration_dir,
+                    input_size,
+                    channels_last=not legacy_converter,
+                    comment_idx=comment_idx,
+                )
+                converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+                converter.inference_input_type = tf.int8
+                converter.inference_output_type = tf.float32
+            elif quantize:
+                converter.optimizations = [tf.lite.Optimize.DEFAULT]
+                converter.target_spec.supported_types = [tf.float16]
+            
+            return converter.convert()
+    
+    # Export to a temporary SavedModel, on tmpfs (RAM) when it has room
+    shm_root = _shm_tmp_root(onnx_path, concurrent)
+    try:
+        tflite_model = convert_in(shm_root)
+    except (OSError, tf.errors.OpError) as e:
+        # TensorFlow file IO reports ENOSPC as an OpError, not an OSError
+        if shm_root is None:
+            raise
+        LOG.warning(f"SavedModel export in {shm_root} failed ({e}), retrying in default temp dir")
+        tflite_model = convert_in(None)
     
     with open(output_path, "wb") as f:
         f.write(tflite_model)
     
-    # Cleanup temp directory
-    import shutil
-    shutil.rmtree(saved_model_dir, ignore_errors=True)
-    
     LOG.info(f"TFLite conversion complete: {output_path}")
 
 
+def export_model(
+    model: nn.Module,
+    stem: str,
+    args: argparse.Namespace,
+    targets: list[str],
+    qat: bool = False,
+) -> list[dict]:
+    """
+    Export a model to ONNX (and TFLite) once per requested rice type specialization.
+    
+    `qat` marks a model already converted by `load_qat_model`.
+    
+    Returns one manifest entry per exported model, describing its inputs,
+    the TFLite image layout, dtype and quantization, and which `targets`
+    (in output order) it predicts.
+    """
+    if args.specialize_comment is None:
+        variants = [None]
+    elif args.specialize_comment == "all":
+        variants = list(range(NUM_COMMENTS))
+    else:
+        variants = [COMMENT_NAMES.index(args.specialize_comment)]
+    
+    entries = []
+    for comment_idx in variants:
+        name = stem if comment_idx is None else f"{stem}_{COMMENT_NAMES[comment_idx]}"
+        
+        onnx_path = args.output_dir / f"{name}.onnx"
+        input_names = export_to_onnx(
+            model,
+            onnx_path,
+            args.mobile_size,
+            args.static_batch,
+            not args.no_simplify,
+            comment_idx,
+        )
+        
+        tflite_path = None
+        if not args.onnx_only:
+            tflite_path = args.output_dir / f"{name}.tflite"
+            convert_onnx_to_tflite(
+                onnx_path,
+                tflite_path,
+                not args.no_quantize,
+                args.quantize_int8,
+                args.calibration_dir,
+                args.mobile_size,
+                args.legacy_converter,
+                comment_idx,
+                qat,
+                args.workers or 1,
+            )
+        
+        tflite = None
+        if tflite_path:
+            if qat:
+                quantization = "int8-qat"
+            elif args.quantize_int8:
+                quantization = "int8"
+            else:
+                quantization = "none" if args.no_quantize else "fp16"
+            tflite = {
+                "file": tflite_path.name,
+                "image_layout": "NCHW" if args.legacy_converter else "NHWC",
+                # QAT models keep a float input and quantize it inside the graph
+                "image_dtype": "int8" if quantization == "int8" else "float32",
+                "quantization": quantization,
+            }
+        
+        entries.append({
+            "name": name,
+            "input_size": args.mobile_size,
+            "onnx": onnx_path.name,
+            "tflite": tflite,
+            "inputs": input_names,
+            "outputs": ["predictions"],
+            "rice_type": COMMENT_NAMES[comment_idx] if comment_idx is not None else None,
+            "targets": targets,
+            "target_indices": [CombinedRiceModel.TARGET_ORDER.index(t) for t in targets],
+        })
+    
+    return entries
+
+
+def write_manifest(output_dir: Path, entries: list[dict]) -> None:
+    """
+    Write `rice_manifest.json` describing the exported models.
+    
+    Entries from earlier runs into the same directory are kept unless
+    re-exported, so the app can pick which specialists to run and where
+    their outputs go in TARGET_ORDER. Each entry records its own input size.
+    """
+    manifest_path = output_dir / "rice_manifest.json"
+    
+    models = {}
+    if manifest_path.exists():
+        models = {m["name"]: m for m in json.loads(manifest_path.read_text())["models"]}
+    models.update({entry["name"]: entry for entry in entries})
+    
+    manifest = {
+        "target_order": CombinedRiceModel.TARGET_ORDER,
+        "models": [models[name] for name in sorted(models)],
+    }
+    manifest_path.write_text(json.dumps(manifest, indent=2) + "\n")
+    LOG.info(f"Wrote manifest: {manifest_path}")
+
+
+def _init_worker(num_threads: int) -> None:
+    """Limit per-process threads so parallel conversions don't oversubscribe cores."""
+    torch.set_num_threads(num_threads)
+    try:
+        import tensorflow as tf
+    except ImportError:
+        return
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+    tf.config.threading.set_intra_op_parallelism_threads(num_threads)
+
+
+def convert_one(
+    ckpt_path: Path,
+    args: argparse.Namespace,
+    backbone: nn.Module | None = None,
+) -> list[dict]:
+    """
+    Convert one specialist checkpoint and return its manifest entries.
+    
+    The model takes ownership of `backbone` if given; otherwise a fresh
+    backbone is built.
+    """
+    model_num = int(ckpt_path.stem.replace("model", ""))
+    targets = CombinedRiceModel.MODEL_TARGETS[model_num]
+    num_targets = len(targets)
+    
+    LOG.info(f"Converting {ckpt_path.name} ({num_targets} targets)")
+    
+    if backbone is None:
+        backbone = create_backbone(pretrained=False)
+    model = RiceRegressorMobile(num_targets=num_targets, backbone=backbone)
+    
+    try:
+        load_checkpoint_weights(model, ckpt_path, model_num)
+    except Exception as e:
+        LOG.warning(f"Could not load weights: {e}")
+    
+    qat_path = args.qat_dir / f"{ckpt_path.stem}.qat.pt" if args.qat_dir else None
+    if qat_path:
+        model = load_qat_model(model, qat_path, args.mobile_size)
+    
+    return export_model(model, ckpt_path.stem, args, targets, qat=qat_path is not None)
+
+
 def main():
     parser = argparse.ArgumentParser(description="Convert rice models for mobile")
     parser.add_argument("--checkpoint", type=Path, help="Single checkpoint to convert")
-    parser.add_argument("--all", action="store_true", help="Convert all 4 models")
-    parser.add_argument("--combined", action="store_true", help="Create combined model")
+    parser.add_argument(
+        "--all", action="store_true", help="Convert all 4 models (recommended for mobile)"
+    )
+    parser.add_argument(
+        "--combined", action="store_true", help="Create combined model (deprecated, use --all)"
+    )
+    parser.add_argument(
+        "--share-backbone",
+        action="store_true",
+        help="Use one backbone in the combined model (only if all checkpoints share it)",
+    )
     parser.add_argument("--mobile-size", type=int, default=384, help="Input size for mobile")
     parser.add_argument("--output-dir", type=Path, default=ROOT / "ml" / "models")
+    parser.add_argument(
+        "--static-batch",
+        action=argparse.BooleanOptionalAction,
+        default=True,
+        help="Export with a fixed batch size of 1 (default for mobile)",
+    )
+    parser.add_argument(
+        "--no-simplify", action="store_true", help="Skip ONNX graph simplification"
+    )
+    parser.add_argument(
+        "--specialize-comment",
+        choices=[*COMMENT_NAMES, "all"],
+        help="Export image-only models with the rice type baked in (one per type with 'all')",
+    )
     parser.add_argument("--onnx-only", action="store_true", help="Skip TFLite conversion")
     parser.add_argument("--no-quantize", action="store_true", help="Skip FP16 quantization")
+    parser.add_argument(
+        "--quantize-int8",
+        action="store_true",
+        help="Full-integer INT8 quantization (requires --calibration-dir)",
+    )
+    parser.add_argument(
+        "--calibration-dir", type=Path, help="Folder of sample rice images for INT8 calibration"
+    )
+    parser.add_argument(
+        "--qat-dir",
+        type=Path,
+        help="Folder of QAT-finetuned state dicts (<output name>.qat.pt) to export quantized",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="Parallel processes for --all (default: min(4, number of checkpoints))",
+    )
+    parser.add_argument(
+        "--legacy-converter",
+        action="store_true",
+        help="Convert ONNX → SavedModel with onnx-tf instead of onnx2tf",
+    )
     
     args = parser.parse_args()
     
+    if args.quantize_int8 and args.calibration_dir is None:
+        parser.error("--quantize-int8 requires --calibration-dir")
+    if args.qat_dir and args.quantize_int8:
+        parser.error("--qat-dir models are already quantized, drop --quantize-int8")
+    
     args.output_dir.mkdir(parents=True, exist_ok=True)
     
     if args.combined:
+        LOG.warning(
+            "--combined is deprecated: use --all and rice_manifest.json so the app "
+            "can skip specialists whose outputs are not needed"
+        )
         LOG.info("Creating combined mobile model...")
-        model = CombinedRiceModel(pretrained=False)
+        model = CombinedRiceModel(pretrained=False, share_backbone=args.share_backbone)
         
-        # Try to load weights from all checkpoints
+        # Try to load weights from all checkpoints; a shared backbone comes
+        # from the first checkpoint that provides one and must match the rest
         ckpt_dir = UNIDO_ROOT / "outputs" / "checkpoints"
+        backbone_loaded = False
         for i in range(1, 5):
             ckpt_path = ckpt_dir / f"model{i}.ckpt"
             if ckpt_path.exists():
-                specialist = getattr(model, f"model{i}")
+                include_backbone = not (model.share_backbone and backbone_loaded)
                 try:
-                    load_checkpoint_weights(specialist, ckpt_path, i)
+                    loaded = load_checkpoint_weights(model, ckpt_path, i, include_backbone)
+                except BackboneMismatchError:
+                    raise
                 except Exception as e:
                     LOG.warning(f"Could not load model{i} weights: {e}")
+                    continue
+                backbone_loaded |= any(key.startswith("backbones.") for key in loaded)
         
-        # Export
-        onnx_path = args.output_dir / "rice_combined.onnx"
-        export_to_onnx(model, onnx_path, args.mobile_size)
+        qat_path = args.qat_dir / "rice_combined.qat.pt" if args.qat_dir else None
+        if qat_path:
+            model = load_qat_model(model, qat_path, args.mobile_size)
         
-        if not args.onnx_only:
-            tflite_path = args.output_dir / "rice_combined.tflite"
-            convert_onnx_to_tflite(onnx_path, tflite_path, not args.no_quantize)
+        # Export
+        entries = export_model(
+            model,
+            "rice_combined",
+            args,
+            CombinedRiceModel.TARGET_ORDER,
+            qat=qat_path is not None,
+        )
+        write_manifest(args.output_dir, entries)
     
     elif args.all or args.checkpoint:
         checkpoints = []
@@ -318,29 +1074,31 @@ def main():
         elif args.checkpoint:
             checkpoints = [args.checkpoint]
         
-        for ckpt_path in checkpoints:
-            model_num = int(ckpt_path.stem.replace("model", ""))
-            num_targets = len(CombinedRiceModel.MODEL_TARGETS[model_num])
-            
-            LOG.info(f"Converting {ckpt_path.name} ({num_targets} targets)")
-            
-            model = RiceRegressorMobile(num_targets=num_targets, pretrained=False)
-            
-            try:
-                load_checkpoint_weights(model, ckpt_path, model_num)
-            except Exception as e:
-                LOG.warning(f"Could not load weights: {e}")
-            
-            onnx_path = args.output_dir / f"{ckpt_path.stem}.onnx"
-            export_to_onnx(model, onnx_path, args.mobile_size)
-            
-            if not args.onnx_only:
-                tflite_path = args.output_dir / f"{ckpt_path.stem}.tflite"
-                convert_onnx_to_tflite(onnx_path, tflite_path, not args.no_quantize)
+        workers = args.workers or min(4, len(checkpoints)) or 1
+        args.workers = workers
+        entries = []
+        if workers > 1:
+            LOG.info(f"Converting {len(checkpoints)} checkpoints with {workers} workers")
+            threads = max(1, (os.cpu_count() or 1) // workers)
+            with ProcessPoolExecutor(
+                max_workers=workers, initializer=_init_worker, initargs=(threads,)
+            ) as ex:
+                results = ex.map(convert_one, checkpoints, [args] * len(checkpoints))
+                for ckpt_entries in results:
+                    entries += ckpt_entries
+        else:
+            # Build the backbone once; the last checkpoint takes the original
+            proto = create_backbone(pretrained=False)
+            for i, ckpt_path in enumerate(checkpoints):
+                last = i == len(checkpoints) - 1
+                entries += convert_one(ckpt_path, args, proto if last else copy.deepcopy(proto))
+            del proto
+        
+        write_manifest(args.output_dir, entries)
     
     else:
         parser.print_help()
-        LOG.info("\nExample: python convert_models.py --combined --mobile-size 384")
+        LOG.info("\nExample: python convert_models.py --all --mobile-size 384")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,180 @@
+"""Smoke tests for the mobile export pipeline in ml/scripts/convert_models.py."""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("timm")
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+
+import convert_models  # noqa: E402
+
+
+class TinyBackbone(torch.nn.Module):
+    """Small stand-in for the timm backbone (pooled features)."""
+
+    num_features = 8
+
+    def __init__(self):
+        super().__init__()
+        self.conv = torch.nn.Conv2d(3, self.num_features, 3, padding=1)
+
+    def forward(self, x):
+        return self.conv(x).mean(dim=(2, 3))
+
+
+def make_model():
+    return convert_models.RiceRegressorMobile(num_targets=2, backbone=TinyBackbone())
+
+
+def test_trace_and_freeze_generic_model():
+    model = make_model()
+    inputs = convert_models.make_dummy_inputs(input_size=16)
+
+    frozen = convert_models.trace_and_freeze(model, inputs)
+
+    with torch.no_grad():
+        assert torch.allclose(frozen(*inputs), model(*inputs))
+
+
+@pytest.mark.parametrize("comment_idx", range(convert_models.NUM_COMMENTS))
+def test_trace_and_freeze_specialized_model(comment_idx):
+    model = make_model().eval()
+    dummy_image, _ = convert_models.make_dummy_inputs(input_size=16)
+    # Freshly constructed wrappers start in training mode
+    specialized = convert_models.SpecializedRiceModel(model, comment_idx)
+
+    frozen = convert_models.trace_and_freeze(specialized, (dummy_image,))
+
+    expected = model(dummy_image, torch.tensor([comment_idx]))
+    with torch.no_grad():
+        assert torch.allclose(frozen(dummy_image), expected)
+
+
+@pytest.fixture
+def tiny_combined(monkeypatch):
+    """Build CombinedRiceModel instances with TinyBackbone backbones."""
+    monkeypatch.setattr(convert_models, "create_backbone", lambda *args, **kwargs: TinyBackbone())
+
+    def build(share_backbone=False):
+        return convert_models.CombinedRiceModel(share_backbone=share_backbone).eval()
+
+    return build
+
+
+def test_combined_output_order_matches_scatter(tiny_combined):
+    model = tiny_combined()
+    # Zero weights so each head outputs its bias: distinct known values per specialist
+    known = {}
+    with torch.no_grad():
+        for model_num, head in zip(model.MODEL_TARGETS, model.heads):
+            head.weight.zero_()
+            head.bias.copy_(torch.arange(head.out_features) + 10.0 * model_num)
+            known[model_num] = head.bias.clone()
+        for bias in model.combined_biases:
+            bias.weight.zero_()
+
+    image, comment = convert_models.make_dummy_inputs(input_size=16)
+    with torch.no_grad():
+        combined = model(image, comment)
+
+    # Baseline: write each specialist output into its global target column
+    expected = torch.zeros(1, len(model.TARGET_ORDER))
+    for model_num, targets in model.MODEL_TARGETS.items():
+        for local_idx, target in enumerate(targets):
+            expected[:, model.TARGET_ORDER.index(target)] = known[model_num][local_idx]
+
+    assert torch.equal(combined, expected)
+
+
+@pytest.mark.parametrize("share_backbone, backbone_idx", [(False, 2), (True, 0)])
+def test_map_specialist_keys(tiny_combined, share_backbone, backbone_idx):
+    model = tiny_combined(share_backbone)
+    state_dict = {
+        "backbone.conv.weight": torch.ones(1),
+        "head.weight": torch.ones(1),
+        "head.bias": torch.ones(1),
+        "combined_bias.weight": torch.ones(1),
+    }
+
+    mapped = model.map_specialist_keys(state_dict, model_num=3)
+
+    assert set(mapped) == {
+        f"backbones.{backbone_idx}.conv.weight",
+        "heads.2.weight",
+        "heads.2.bias",
+        "combined_biases.2.weight",
+    }
+    assert "backbones.0.conv.weight" not in model.map_specialist_keys(
+        state_dict, model_num=3, include_backbone=False
+    )
+
+
+def test_check_shared_backbone(tiny_combined):
+    model = tiny_combined(share_backbone=True)
+    backbone_state = {
+        key: value.clone() for key, value in model.state_dict().items()
+        if key.startswith("backbones.")
+    }
+
+    model.check_shared_backbone(backbone_state, Path("model2.ckpt"))
+
+    backbone_state["backbones.0.conv.weight"] += 1
+    with pytest.raises(convert_models.BackboneMismatchError):
+        model.check_shared_backbone(backbone_state, Path("model2.ckpt"))
+
+
+def test_fold_comment_pathway_matches_training_head(tmp_path):
+    torch.manual_seed(0)
+    num_targets, emb_dim = 2, 4
+    backbone = TinyBackbone()
+    feat_dim = backbone.num_features
+
+    # Training (baseline) layout: Linear(cat([feats, comment_emb[c]])) + comment_bias[c]
+    state_dict = {f"backbone.{key}": value for key, value in backbone.state_dict().items()}
+    state_dict.update({
+        "head.1.weight": torch.randn(num_targets, feat_dim + emb_dim),
+        "head.1.bias": torch.randn(num_targets),
+        "comment_emb.weight": torch.randn(convert_models.NUM_COMMENTS, emb_dim),
+        "comment_bias.weight": torch.randn(convert_models.NUM_COMMENTS, num_targets),
+    })
+    ckpt_path = tmp_path / "model1.ckpt"
+    torch.save({"heads": {"head": {"state_dict": state_dict}}}, ckpt_path)
+
+    model = convert_models.RiceRegressorMobile(num_targets=num_targets, backbone=TinyBackbone())
+    convert_models.load_checkpoint_weights(model, ckpt_path, model_num=1)
+    model.eval()
+
+    image, _ = convert_models.make_dummy_inputs(input_size=16)
+    for comment_idx in range(convert_models.NUM_COMMENTS):
+        comment = torch.tensor([comment_idx])
+        with torch.no_grad():
+            feats = backbone(image)
+            emb = state_dict["comment_emb.weight"][comment]
+            expected = torch.nn.functional.linear(
+                torch.cat([feats, emb], dim=1),
+                state_dict["head.1.weight"],
+                state_dict["head.1.bias"],
+            ) + state_dict["comment_bias.weight"][comment]
+
+            assert torch.allclose(model(image, comment), expected, atol=1e-5)
+
+
+def test_qat_model_exports_to_onnx(tmp_path):
+    pytest.importorskip("onnx")
+    input_size = 16
+    qat_model = convert_models.prepare_qat(make_model(), input_size)
+    qat_path = tmp_path / "model1.qat.pt"
+    torch.save(qat_model.state_dict(), qat_path)
+
+    model = convert_models.load_qat_model(make_model(), qat_path, input_size)
+    onnx_path = tmp_path / "model1.onnx"
+    input_names = convert_models.export_to_onnx(
+        model, onnx_path, input_size, simplify=False
+    )
+
+    assert input_names == ["image", "comment_idx"]
+    assert onnx_path.stat().st_size > 0